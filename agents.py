@@ -1,36 +1,55 @@
-from dotenv import load_dotenv
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 
 from openai import OpenAI
-from swarm import Swarm, Agent
+from swarm import Agent
+import common  # noqa: F401 - loads .env before user_context reads the environment
 from gmail import read_emails, write_email, search_for_emails, get_email_by_id
 from google_calendar import list_upcoming_events, create_event, delete_event, update_event
 from x import send_tweet
 from spotify import play, get_current_track, control_playback, search
+from parallel_swarm import ParallelSwarm, parallel_safe, read_only
 
-# Load environment variables
-load_dotenv()
-
-# Load context variables from environment
-default_context = {
+# Load user context variables from environment
+user_context = {
     "user_name": os.getenv("USER_NAME", "User"),
     "email": os.getenv("USER_EMAIL", "unknown@example.com"),
     "preferred_language": os.getenv("PREFERRED_LANGUAGE", "English"),
     "location": os.getenv("USER_LOCATION", "N/A"),
     "twitter_username": os.getenv("TWITTER_USERNAME", "N/A"),
     "tweet_preferred_language": os.getenv("TWEET_PREFERRED_LANGUAGE", "English"),
-    "current_datetime": datetime.now().isoformat(),
 }
 
 
-def base_assistant_instructions(context_variables):
-    user_name = context_variables.get("user_name", "User")
-    preferred_language = context_variables.get("preferred_language", "English")
-    location = context_variables.get("location", "N/A")
-    current_datetime = context_variables.get("current_datetime", datetime.now().isoformat())
+def build_context():
+    """Return the context variables for a conversation turn, with a fresh current_datetime."""
+    return {**user_context, "current_datetime": datetime.now().astimezone().isoformat()}
+
+
+# Fallbacks for context variables missing when rendering the instruction templates
+PROMPT_DEFAULTS = {
+    "user_name": "User",
+    "email": "N/A",
+    "preferred_language": "English",
+    "location": "N/A",
+    "twitter_username": "N/A",
+    "tweet_preferred_language": "Polish",
+}
+
+
+class PromptContext(dict):
+    """Context variables with fallbacks, only looked up for keys a template actually uses."""
 
-    return f"""
+    def __missing__(self, key):
+        if key == "current_datetime":
+            return datetime.now().astimezone().isoformat()
+        return PROMPT_DEFAULTS[key]
+
+
+BASE_ASSISTANT_PROMPT = """
     You are a personal assistant for {user_name}. You coordinate between specialized agents for email, calendar, and social media tasks.
     Use the following user information to personalize your responses:
     - User Name: {user_name}
@@ -43,11 +62,10 @@ def base_assistant_instructions(context_variables):
     """
 
 
-def email_assistant_instructions(context_variables):
-    return f"""
-    You are an email management specialist for {context_variables.get('user_name', 'User')}.
-    User Email: {context_variables.get('email', 'N/A')}
-    Preferred Language: {context_variables.get('preferred_language', 'English')}
+EMAIL_ASSISTANT_PROMPT = """
+    You are an email management specialist for {user_name}.
+    User Email: {email}
+    Preferred Language: {preferred_language}
     
     You can:
     - Read and search emails
@@ -66,12 +84,11 @@ def email_assistant_instructions(context_variables):
     """
 
 
-def calendar_assistant_instructions(context_variables):
-    return f"""
-    You are a calendar management specialist for {context_variables.get('user_name', 'User')}.
-    Current Datetime: {context_variables.get('current_datetime', datetime.now().isoformat())}
-    User Preferred Language: {context_variables.get('preferred_language', 'English')}
-    User Location: {context_variables.get('location', 'N/A')}
+CALENDAR_ASSISTANT_PROMPT = """
+    You are a calendar management specialist for {user_name}.
+    Current Datetime: {current_datetime}
+    User Preferred Language: {preferred_language}
+    User Location: {location}
     
     You can:
     - List upcoming events
@@ -86,11 +103,10 @@ def calendar_assistant_instructions(context_variables):
     """
 
 
-def social_media_assistant_instructions(context_variables):
-    return f"""
-    You are a social media specialist for {context_variables.get('user_name', 'User')}.
-    Twitter Username: {context_variables.get('twitter_username', 'N/A')}
-    User Language: {context_variables.get('tweet_preferred_language', 'Polish')}
+SOCIAL_MEDIA_ASSISTANT_PROMPT = """
+    You are a social media specialist for {user_name}.
+    Twitter Username: {twitter_username}
+    User Language: {tweet_preferred_language}
     
     You can:
     - Send tweets on User's Twitter account with engaging content.
@@ -103,10 +119,9 @@ def social_media_assistant_instructions(context_variables):
     """
 
 
-def music_assistant_instructions(context_variables):
-    return f"""
-    You are a music assistant for {context_variables.get('user_name', 'User')}.
-    Preferred Language: {context_variables.get('preferred_language', 'English')}
+MUSIC_ASSISTANT_PROMPT = """
+    You are a music assistant for {user_name}.
+    Preferred Language: {preferred_language}
     
     You can:
     - Search for content on Spotify (tracks, albums, artists, playlists)
@@ -123,6 +138,84 @@ def music_assistant_instructions(context_variables):
     """
 
 
+DAILY_OVERVIEW_PROMPT = """
+    You are a daily briefing assistant for {user_name}.
+    Current Datetime: {current_datetime}
+    Preferred Language: {preferred_language}
+
+    You can:
+    - Get an overview of the user's day: unread emails, upcoming events and the current track
+
+    Rules:
+    - Call get_daily_overview once and summarize the most important items briefly.
+    - For follow-up questions about a specific email, event or song, transfer back to the base agent.
+    """
+
+
+def base_assistant_instructions(context_variables):
+    return BASE_ASSISTANT_PROMPT.format_map(PromptContext(context_variables))
+
+
+def email_assistant_instructions(context_variables):
+    return EMAIL_ASSISTANT_PROMPT.format_map(PromptContext(context_variables))
+
+
+def calendar_assistant_instructions(context_variables):
+    return CALENDAR_ASSISTANT_PROMPT.format_map(PromptContext(context_variables))
+
+
+def social_media_assistant_instructions(context_variables):
+    return SOCIAL_MEDIA_ASSISTANT_PROMPT.format_map(PromptContext(context_variables))
+
+
+def music_assistant_instructions(context_variables):
+    return MUSIC_ASSISTANT_PROMPT.format_map(PromptContext(context_variables))
+
+
+def daily_overview_instructions(context_variables):
+    return DAILY_OVERVIEW_PROMPT.format_map(PromptContext(context_variables))
+
+
+# get_daily_overview runs on the tool executor and waits for these tools, which in turn may wait on
+# common.REQUEST_EXECUTOR, so they get a pool of their own instead of nesting on TOOL_EXECUTOR
+_overview_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='overview')
+
+# Sections not ready within this many seconds are reported as errors instead of holding up the overview
+OVERVIEW_TIMEOUT = 30
+
+
+def _overview_section(future, name, deadline):
+    """Return the result of one overview section, or an error result if it failed or timed out."""
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        error_message = f"<result><error>Timed out getting {name}</error></result>"
+    except Exception as e:
+        error_message = f"<result><error>Error getting {name}: {str(e)}</error></result>"
+    logging.error(error_message)
+    return error_message
+
+
+def get_daily_overview(context_variables):
+    """
+    Get an overview of the user's day: unread emails from the last day, upcoming calendar events and the currently playing track.
+
+    Args:
+        context_variables (dict): A dictionary containing context information.
+    """
+    emails = _overview_executor.submit(read_emails, context_variables, unread=True, date_filter='newer_than:1d')
+    events = _overview_executor.submit(list_upcoming_events, context_variables, max_results=5)
+    track = _overview_executor.submit(get_current_track, context_variables)
+
+    # One deadline for all sections, so a failing domain costs at most OVERVIEW_TIMEOUT in total
+    deadline = time.monotonic() + OVERVIEW_TIMEOUT
+    return f"""<result>
+<unread_emails>{_overview_section(emails, 'unread emails', deadline)}</unread_emails>
+<upcoming_events>{_overview_section(events, 'upcoming events', deadline)}</upcoming_events>
+<current_track>{_overview_section(track, 'current track', deadline)}</current_track>
+</result>"""
+
+
 # Specialized Agents
 base_agent = Agent(
     name="Base Assistant",
@@ -176,6 +269,17 @@ music_agent = Agent(
 )
 
 
+# Answers multi-domain questions about the day in a single turn instead of a triage hop per domain
+fanout_agent = Agent(
+    name="Daily Overview Assistant",
+    instructions=daily_overview_instructions,
+    model=os.getenv("default_model", "gpt-4o-mini"),
+    functions=[
+        get_daily_overview,
+    ]
+)
+
+
 # Transfer Functions
 def transfer_to_email_agent():
     """ Transfer to the Email Assistant """
@@ -209,10 +313,20 @@ base_agent.functions = [
     transfer_to_social_media_agent,
     transfer_to_music_agent
 ]
+# Tool functions share no mutable state, so independent calls can run concurrently
+for func in (email_agent.functions + calendar_agent.functions + social_media_agent.functions
+             + music_agent.functions + fanout_agent.functions):
+    parallel_safe(func)
+# Lookups without side effects can already start while the completion is streaming
+for func in (read_emails, search_for_emails, get_email_by_id, list_upcoming_events,
+             search, get_current_track, get_daily_overview):
+    read_only(func)
+
 email_agent.functions.append(transfer_back_to_base_agent)
 calendar_agent.functions.append(transfer_back_to_base_agent)
 social_media_agent.functions.append(transfer_back_to_base_agent)
 music_agent.functions.append(transfer_back_to_base_agent)
+fanout_agent.functions.append(transfer_back_to_base_agent)
 
 # Example usage
 if __name__ == "__main__":
@@ -222,12 +336,12 @@ if __name__ == "__main__":
         base_url="https://openrouter.ai/api/v1",
         api_key=os.getenv("llm_api_key"),
     )
-    client = Swarm(client=openai_client)
+    client = ParallelSwarm(client=openai_client)
 
     response = client.run(
         agent=base_agent,
         messages=[{"role": "user", "content": "Can you check my today unread emails?"}],
-        context_variables=default_context
+        context_variables=build_context()
     )
 
     print("\nFinal response:")
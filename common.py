@@ -1,18 +1,252 @@
 from dotenv import load_dotenv
 import os
 import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+from google.auth.transport.requests import AuthorizedSession, Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 
 # Load environment variables
 load_dotenv()
 
+# Shared pool for all blocking Google/Spotify/X API calls made off the main thread
+MAX_WORKERS = 16
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='tool')
+
+# Individual API requests fanned out from inside a tool call. The tool call blocks on them while
+# occupying a TOOL_EXECUTOR worker, so they need their own pool: waiting on futures of the pool
+# you run on deadlocks once all its workers are waiting. Tasks on this pool must not wait on others.
+REQUEST_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='request')
+
+# Sent with requests made through pooled_session()
+USER_AGENT = 'assistantAI'
+
+# Credentials and services are created on first use and reused across tool calls
+_service_cache = {'gmail': None, 'calendar': None, 'creds': None, 'http': None}
+_service_lock = threading.Lock()
+
+# Credentials are refreshed this long before they expire so no refresh happens in the middle of a tool call
+REFRESH_MARGIN = timedelta(seconds=60)
+
+
+# Idempotent requests are retried by googleapiclient with exponential backoff and jitter
+# on 429/5xx responses and connection errors
+NUM_RETRIES = 4
+IDEMPOTENT_METHODS = {'GET', 'PUT', 'PATCH', 'DELETE'}
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AuthorizationRequiredError(RuntimeError):
+    """Raised when Google authorization needs user interaction but no terminal is attached."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request while the API has been failing repeatedly."""
+
+
+class CircuitBreaker:
+    """
+    Fails calls immediately for `reset_timeout` seconds once `max_failures` transient failures
+    happened within `window` seconds, then lets requests through again.
+    """
+
+    def __init__(self, max_failures=5, window=60, reset_timeout=30):
+        self.max_failures = max_failures
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self._failures = deque()
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Google API is temporarily unavailable, please try again later.")
+            self._opened_at = None
+            self._failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if len(self._failures) >= self.max_failures:
+                logging.warning("Opening circuit breaker after %d failures", len(self._failures))
+                self._opened_at = now
+
+
+_google_breaker = CircuitBreaker()
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter allowing `rpm` requests per minute with bursts of up to `burst` requests.
+    acquire() blocks until a request may be sent, so requests are paced instead of running into 429s.
+    """
+
+    def __init__(self, rpm, burst):
+        self.rpm = rpm
+        self.burst = burst
+        self.tokens = burst
+        self.last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_update) * self.rpm / 60)
+            self.last_update = now
+            # Take the token up front; a negative balance reserves it for the caller once it has been refilled
+            self.tokens -= 1
+            wait_time = -self.tokens * 60 / self.rpm if self.tokens < 0 else 0
+        if wait_time:
+            logging.info("Rate limit reached, waiting %.2fs", wait_time)
+            time.sleep(wait_time)
+
+
+class _RateLimitedSession(requests.Session):
+    """requests session that takes a token from `bucket` before every request."""
+
+    def __init__(self, bucket):
+        super().__init__()
+        self.bucket = bucket
+
+    def request(self, *args, **kwargs):
+        self.bucket.acquire()
+        return super().request(*args, **kwargs)
+
+
+def get_gmail_service():
+    """Return the authenticated Gmail service, building it on first use."""
+    return _get_service('gmail', 'v1')
+
+
+def get_calendar_service():
+    """Return the authenticated Calendar service, building it on first use."""
+    return _get_service('calendar', 'v3')
+
 
 def authenticate_gmail():
     """Authenticate and return Gmail and Calendar services."""
-    logging.info("Function called: authenticate_gmail()")
+    return get_gmail_service(), get_calendar_service()
+
+
+def execute_request(request):
+    """
+    Execute a Google API request or batch, retrying transient errors of idempotent requests
+    and failing fast while the circuit breaker is open.
+    """
+    _google_breaker.before_call()
+    try:
+        if isinstance(request, BatchHttpRequest):
+            response = request.execute()
+        else:
+            num_retries = NUM_RETRIES if request.method in IDEMPOTENT_METHODS else 0
+            response = request.execute(num_retries=num_retries)
+    except HttpError as e:
+        if e.resp.status in TRANSIENT_STATUSES:
+            _google_breaker.record_failure()
+        raise
+    except OSError:
+        _google_breaker.record_failure()
+        raise
+    return response
+
+
+def _get_service(name, version):
+    """Return a cached Google API service, building it with the shared transport if needed."""
+    with _service_lock:
+        creds = _service_cache['creds']
+        if creds and creds.refresh_token and (not creds.valid or _expires_soon(creds)):
+            creds.refresh(Request())
+        elif not creds or not creds.valid:
+            creds = _get_creds()
+            _service_cache.update(gmail=None, calendar=None, creds=creds, http=SessionHttp(creds))
+
+        if _service_cache[name] is None:
+            logging.info("Building %s %s service", name, version)
+            # Use the discovery documents bundled with googleapiclient to avoid fetching them over the network
+            _service_cache[name] = build(name, version, http=_service_cache['http'],
+                                         static_discovery=True, cache_discovery=False)
+        return _service_cache[name]
+
+
+def _expires_soon(creds):
+    """Check whether the credentials expire within REFRESH_MARGIN."""
+    if not creds.expiry:
+        return False
+    # google-auth stores expiry as a naive UTC datetime
+    return creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None) < REFRESH_MARGIN
+
+
+def _save_token(creds, token_path):
+    """Atomically write the credentials so a crash mid-write cannot corrupt the token file."""
+    tmp_path = token_path + '.tmp'
+    with open(tmp_path, 'w') as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, token_path)
+
+
+def pooled_session(pool_maxsize=MAX_WORKERS, retries=0, rate_limit=None):
+    """
+    Return a requests session that keeps up to `pool_maxsize` connections per host alive,
+    so consecutive API calls skip the TCP and TLS handshakes.
+
+    Args:
+        pool_maxsize (int): Maximum number of connections kept per host.
+        retries (int | urllib3.util.Retry): Retry policy for the mounted adapter.
+        rate_limit (TokenBucket, optional): Limiter every request made through the session waits on.
+    """
+    session = _RateLimitedSession(rate_limit) if rate_limit else requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize, max_retries=retries))
+    return session
+
+
+class SessionHttp:
+    """
+    httplib2-compatible transport for googleapiclient backed by google-auth's AuthorizedSession.
+    Unlike httplib2 it keeps a pool of keep-alive connections and is safe to share between threads.
+    """
+
+    def __init__(self, creds, timeout=60):
+        # googleapiclient looks up the credentials on the http object when refreshing batch requests
+        self.credentials = creds
+        self.timeout = timeout
+        self.session = AuthorizedSession(creds)
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=MAX_WORKERS))
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        try:
+            response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout)
+        # googleapiclient only retries the builtin exceptions, requests' own carry no errno
+        except requests.Timeout as e:
+            raise TimeoutError(str(e)) from e
+        except requests.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+        info = dict(response.headers)
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+
+def _get_creds():
+    """Load the stored credentials, refreshing them or running the OAuth flow if needed."""
     SCOPES = [
         'https://www.googleapis.com/auth/gmail.modify',
         'https://www.googleapis.com/auth/calendar',  # Full access to Calendar
@@ -34,10 +268,14 @@ def authenticate_gmail():
             creds = None
 
     # If creds is None or invalid, we need to generate new credentials
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+    if not creds or not creds.valid or _expires_soon(creds):
+        if creds and creds.refresh_token:
             creds.refresh(Request())
         else:
+            if not sys.stdin.isatty():
+                raise AuthorizationRequiredError(
+                    "Google authorization required. Run `python gmail.py` in a terminal to generate a token.")
+
             flow = InstalledAppFlow.from_client_secrets_file(
                 credentials_path, SCOPES)
             
@@ -58,10 +296,6 @@ def authenticate_gmail():
             creds = flow.credentials
 
             # Save the credentials for the next run
-            with open(token_path, 'w') as token:
-                token.write(creds.to_json())
+            _save_token(creds, token_path)
 
-    service_gmail = build('gmail', 'v1', credentials=creds)
-    service_calendar = build('calendar', 'v3', credentials=creds)
-    logging.info("Function authenticate_gmail() returned: Gmail and Calendar service objects")
-    return service_gmail, service_calendar
+    return creds
@@ -1,66 +1,173 @@
-from dotenv import load_dotenv
 import logging
 import base64
-from email.mime.text import MIMEText
+import threading
+import time
+from email.message import EmailMessage
+from html import escape
 
-from common import authenticate_gmail
+from googleapiclient.errors import HttpError
 
-# Load environment variables
-load_dotenv()
+from common import authenticate_gmail, execute_request, get_gmail_service, REQUEST_EXECUTOR
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Gmail accepts at most 100 calls in a single batch request
+BATCH_SIZE = 100
 
-def read_emails(context_variables, unread: bool, number_of_emails: int = 30, date_filter: str = None):
+# Cached listings are revalidated against the mailbox history, but relative date filters
+# such as 'newer_than:1d' still require a full listing after this many seconds
+SYNC_EXPIRATION_SECONDS = 300
+
+# (query, max_results) -> {'history_id': ..., 'synced_at': ..., 'messages': [...]}
+_listing_cache = {}
+_listing_cache_lock = threading.Lock()
+
+
+def _metadata_request(service, message_id):
+    """Build a request for the From/Subject headers and snippet of a message."""
+    return service.users().messages().get(
+        userId='me',
+        id=message_id,
+        format='metadata',
+        metadataHeaders=['From', 'Subject'],
+        fields='id,snippet,payload/headers'
+    )
+
+
+def _fetch_message_metadata(service, messages):
+    """
+    Fetch the From/Subject headers and snippet of the given messages using batch requests.
+    Falls back to concurrent individual requests if the batch endpoint fails, and re-fetches
+    messages whose part of the batch failed (e.g. throttled with 429) individually.
+
+    Args:
+        service: Authenticated Gmail service object.
+        messages (list): Message references as returned by messages().list().
+
+    Returns:
+        list: Message resources in the same order as `messages`.
+    """
+    responses = {}
+
+    def callback(request_id, response, exception):
+        responses[request_id] = exception if exception is not None else response
+
+    try:
+        for start in range(0, len(messages), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for message in messages[start:start + BATCH_SIZE]:
+                batch.add(_metadata_request(service, message['id']), request_id=message['id'])
+            execute_request(batch)
+    except HttpError as e:
+        logging.warning("Batch request failed, fetching messages individually: %s", e)
+        requests = [_metadata_request(service, message['id']) for message in messages]
+        return list(REQUEST_EXECUTOR.map(execute_request, requests))
+
+    failed_ids = [message['id'] for message in messages if isinstance(responses[message['id']], Exception)]
+    if failed_ids:
+        # Individual requests are retried with backoff and counted by the circuit breaker
+        logging.warning("%d batched requests failed, fetching them individually", len(failed_ids))
+        requests = [_metadata_request(service, message_id) for message_id in failed_ids]
+        responses.update(zip(failed_ids, REQUEST_EXECUTOR.map(execute_request, requests)))
+    return [responses[message['id']] for message in messages]
+
+
+def _mailbox_changed(service, history_id):
+    """Check whether anything in the mailbox changed since the given history ID."""
+    try:
+        history = execute_request(service.users().history().list(
+            userId='me',
+            startHistoryId=history_id,
+            maxResults=1,
+            fields='history(id)'
+        ))
+    except HttpError as e:
+        # Gmail only keeps history for a limited time and responds with 404 for expired IDs
+        if e.resp.status == 404:
+            return True
+        raise
+    return bool(history.get('history'))
+
+
+def _list_emails(service, query, max_results):
+    """
+    List the messages matching a query together with their metadata.
+
+    Listings are cached per query; a repeated listing of an unchanged mailbox is answered with
+    a single history.list call instead of messages().list() plus the metadata batch.
+    """
+    key = (query, max_results)
+    now = time.monotonic()
+    with _listing_cache_lock:
+        cached = _listing_cache.get(key)
+    if cached and now - cached['synced_at'] < SYNC_EXPIRATION_SECONDS:
+        if not _mailbox_changed(service, cached['history_id']):
+            logging.info("Serving '%s' listing from cache, mailbox unchanged", query)
+            return cached['messages']
+
+    # Record the history ID before listing so changes made during the listing are picked up next time
+    history_id = execute_request(service.users().getProfile(userId='me', fields='historyId'))['historyId']
+    results = execute_request(service.users().messages().list(
+        userId='me',
+        q=query,
+        maxResults=max_results
+    ))
+    messages = results.get('messages', [])
+    messages = _fetch_message_metadata(service, messages) if messages else []
+
+    # Listings run concurrently on the tool executor, so the sweep and insert must not interleave
+    with _listing_cache_lock:
+        for expired in [k for k, v in _listing_cache.items() if now - v['synced_at'] >= SYNC_EXPIRATION_SECONDS]:
+            del _listing_cache[expired]
+        _listing_cache[key] = {'history_id': history_id, 'synced_at': now, 'messages': messages}
+    return messages
+
+
+def _build_query(*filters):
+    """Combine Gmail search filters into a single `q` parameter, skipping empty ones."""
+    return ' '.join(f.strip() for f in filters if f and f.strip())
+
+
+def read_emails(context_variables, unread: bool, number_of_emails: int = 10, date_filter: str = None):
     """
     Read emails based on the specified criteria.
 
     Args:
         context_variables (dict): A dictionary containing context information.
         unread (bool): If True, only fetch unread emails. If False, fetch all emails.
-        number_of_emails (int): The maximum number of emails to retrieve, based on the query. Minimum is 30, set to higher if needed.
-        date_filter (str, optional): Date filter in Gmail format i.e. 'newer_than:2d', 'older_than:1w'
+        number_of_emails (int): The maximum number of emails to retrieve. Use the number the user asked for, i.e. 1 for "my last email".
+        date_filter (str, optional): Date filter in Gmail format i.e. 'newer_than:2d', 'older_than:1w', 'after:2024/01/31'
     """
-    logging.info(
-        f"Function called: read_emails(context_variables={context_variables}, unread={unread}, number_of_emails={number_of_emails}, date_filter={date_filter})")
+    logging.info("Function called: read_emails(unread=%s, number_of_emails=%s, date_filter=%s)",
+                 unread, number_of_emails, date_filter)
 
-    service, _ = authenticate_gmail()
     try:
-        query = 'is:unread' if unread else ''
-        if date_filter:
-            query += ' ' + date_filter
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=number_of_emails
-        ).execute()
-        messages = results.get('messages', [])
+        service = get_gmail_service()
+        query = _build_query('is:unread' if unread else None, date_filter)
+        messages = _list_emails(service, query, number_of_emails)
 
         if not messages:
             return f"<result><message>No {'unread ' if unread else ''}emails found.</message></result>"
 
         email_info = []
-        for message in messages:
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
+        for msg in messages:
             payload = msg['payload']
             headers = payload['headers']
 
-            email_id = message['id']
+            email_id = msg['id']
             subject = next((header['value'] for header in headers if header['name'].lower() == 'subject'), 'No subject')
             sender = next((header['value'] for header in headers if header['name'].lower() == 'from'), 'Unknown sender')
 
             # Use the snippet instead of the full body
             snippet = msg.get('snippet', 'No snippet available')
 
-            # Escape special characters in snippet
-            snippet = snippet.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-
             email_info.append(
-                f"<email><id>{email_id}</id><from>{sender}</from><subject>{subject}</subject><snippet>{snippet}</snippet></email>")
+                f"<email><id>{email_id}</id><from>{escape(sender, quote=False)}</from>"
+                f"<subject>{escape(subject, quote=False)}</subject><snippet>{escape(snippet, quote=False)}</snippet></email>")
 
-        result = f"<result>\n{'\n'.join(email_info)}\n</result>"
-        logging.info(f"Function read_emails() returned: {len(email_info)} emails")
+        result = "<result>\n" + "\n".join(email_info) + "\n</result>"
+        logging.info("Function read_emails() returned: %d emails", len(email_info))
         return result
     except Exception as e:
         error_message = f"<result><error>Error reading emails: {str(e)}</error></result>"
@@ -68,52 +175,45 @@ def read_emails(context_variables, unread: bool, number_of_emails: int = 30, dat
         return error_message
 
 
-def search_for_emails(context_variables, query: str, max_results: int = 30, date_filter: str = None):
+def search_for_emails(context_variables, query: str, max_results: int = 10, date_filter: str = None):
     """
-    Search for emails based on the specified query.
+    Search for emails based on the specified query. All filtering is done by Gmail, so express every
+    criterion with Gmail search operators instead of filtering the results afterwards.
 
     Args:
         context_variables (dict): A dictionary containing context information.
-        query (str): The search query to filter emails.
-        max_results (int): The maximum number of emails to retrieve, based on the query. Minimum is 30, set to higher if needed.
-        date_filter (str, optional): Date filter in Gmail format i.e. 'newer_than:2d', 'older_than:1w'
+        query (str): The search query in Gmail format i.e. 'from:john@example.com', 'subject:invoice', 'has:attachment', 'is:unread', 'label:work'. Operators can be combined with spaces.
+        max_results (int): The maximum number of emails to retrieve. Use the number the user asked for.
+        date_filter (str, optional): Date filter in Gmail format i.e. 'newer_than:2d', 'older_than:1w', 'after:2024/01/31'
     """
-    logging.info(
-        f"Function called: search_for_emails(context_variables={context_variables}, query='{query}', max_results={max_results}, date_filter={date_filter})")
+    logging.info("Function called: search_for_emails(query='%s', max_results=%s, date_filter=%s)",
+                 query, max_results, date_filter)
 
-    service, _ = authenticate_gmail()
     try:
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=max_results
-        ).execute()
-        messages = results.get('messages', [])
+        service = get_gmail_service()
+        messages = _list_emails(service, _build_query(query, date_filter), max_results)
 
         if not messages:
             return f"<result><message>No emails found matching the query: '{query}'</message></result>"
 
         email_info = []
-        for message in messages:
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
+        for msg in messages:
             payload = msg['payload']
             headers = payload['headers']
 
-            email_id = message['id']
+            email_id = msg['id']
             subject = next((header['value'] for header in headers if header['name'].lower() == 'subject'), 'No subject')
             sender = next((header['value'] for header in headers if header['name'].lower() == 'from'), 'Unknown sender')
 
             # Use the snippet instead of the full body
             snippet = msg.get('snippet', 'No snippet available')
 
-            # Escape special characters in snippet
-            snippet = snippet.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-
             email_info.append(
-                f"<email><id>{email_id}</id><from>{sender}</from><subject>{subject}</subject><snippet>{snippet}</snippet></email>")
+                f"<email><id>{email_id}</id><from>{escape(sender, quote=False)}</from>"
+                f"<subject>{escape(subject, quote=False)}</subject><snippet>{escape(snippet, quote=False)}</snippet></email>")
 
-        result = f"<result>\n{''.join(email_info)}\n</result>"
-        logging.info(f"Function search_for_emails() returned: {len(email_info)} emails")
+        result = "<result>\n" + "".join(email_info) + "\n</result>"
+        logging.info("Function search_for_emails() returned: %d emails", len(email_info))
         return result
     except Exception as e:
         error_message = f"<result><error>Error searching emails: {str(e)}</error></result>"
@@ -131,28 +231,28 @@ def write_email(context_variables, to: str, subject: str, body: str):
         subject (str): The subject of the email.
         body (str): The content of the email.
     """
-    logging.info(
-        f"Function called: write_email(context_variables={context_variables}, to='{to}', subject='{subject}', body='{body[:20]}...')")
+    logging.info("Function called: write_email(to='%s', subject='%s')", to, subject)
 
     user_name = context_variables.get("user_name", "User")
     user_email = context_variables.get("email", "unknown@example.com")
 
-    service, _ = authenticate_gmail()
     try:
-        message = MIMEText(body)
-        message['to'] = to
-        message['from'] = user_email
-        message['subject'] = subject
+        service = get_gmail_service()
+        message = EmailMessage()
+        message['To'] = to
+        message['From'] = user_email
+        message['Subject'] = subject
+        message.set_content(body)
 
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        raw_message = base64.urlsafe_b64encode(bytes(message)).decode()
 
-        message = service.users().messages().send(
+        message = execute_request(service.users().messages().send(
             userId='me',
             body={'raw': raw_message}
-        ).execute()
+        ))
 
         result = f"<result><message>Email sent successfully. Message ID: {message['id']}</message></result>"
-        logging.info(f"Function write_email() returned: {result}")
+        logging.info("Function write_email() returned: %s", result)
         return result
     except Exception as e:
         error_message = f"<result><error>Error sending email: {str(e)}</error></result>"
@@ -168,11 +268,11 @@ def get_email_by_id(context_variables, email_id: str):
         context_variables (dict): A dictionary containing context information.
         email_id (str): The unique identifier of the email to retrieve.
     """
-    logging.info(f"Function called: get_email_by_id(context_variables={context_variables}, email_id='{email_id}')")
+    logging.info("Function called: get_email_by_id(email_id='%s')", email_id)
 
-    service, _ = authenticate_gmail()
     try:
-        msg = service.users().messages().get(userId='me', id=email_id).execute()
+        service = get_gmail_service()
+        msg = execute_request(service.users().messages().get(userId='me', id=email_id))
         payload = msg['payload']
         headers = payload['headers']
 
@@ -190,19 +290,16 @@ def get_email_by_id(context_variables, email_id: str):
         elif payload.get('body', {}).get('data'):
             body = base64.urlsafe_b64decode(payload['body']['data']).decode()
 
-        # Escape special characters in body
-        body = body.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-
         email_info = f"""<email>
   <id>{email_id}</id>
-  <from>{sender}</from>
-  <subject>{subject}</subject>
-  <date>{date}</date>
-  <body>{body}</body>
+  <from>{escape(sender, quote=False)}</from>
+  <subject>{escape(subject, quote=False)}</subject>
+  <date>{escape(date, quote=False)}</date>
+  <body>{escape(body, quote=False)}</body>
 </email>"""
 
         result = f"<result>\n{email_info}\n</result>"
-        logging.info(f"Function get_email_by_id() returned: Email with ID {email_id}")
+        logging.info("Function get_email_by_id() returned: Email with ID %s", email_id)
         return result
     except Exception as e:
         error_message = f"<result><error>Error retrieving email with ID {email_id}: {str(e)}</error></result>"
@@ -1,16 +1,42 @@
-from dotenv import load_dotenv
 import logging
+import re
 from datetime import datetime, timedelta, timezone
-from common import authenticate_gmail
-
-# Load environment variables
-load_dotenv()
+from html import escape
+from common import execute_request, get_calendar_service
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# UTC timestamps in this format are accepted by the Calendar API as-is
+RFC3339_UTC_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z')
+
+# Event descriptions are cut to this length unless requested in full, to keep the model's prompt small
+DESCRIPTION_PREVIEW_LENGTH = 200
+
+
+def _format_event(event, include_descriptions):
+    """Format a single event as XML for the model."""
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    end = event['end'].get('dateTime', event['end'].get('date'))
+    attendee_list = [attendee['email'] for attendee in event.get('attendees', []) if 'email' in attendee]
+
+    description = event.get('description', 'No description')
+    if not include_descriptions and len(description) > DESCRIPTION_PREVIEW_LENGTH:
+        description = description[:DESCRIPTION_PREVIEW_LENGTH] + '...'
+
+    return f"""<event>
+    <id>{event['id']}</id>
+    <summary>{escape(event.get('summary', 'No title'), quote=False)}</summary>
+    <start>{start}</start>
+    <end>{end}</end>
+    <location>{escape(event.get('location', 'No location'), quote=False)}</location>
+    <description>{escape(description, quote=False)}</description>
+    <attendees>{escape(', '.join(attendee_list), quote=False)}</attendees>
+</event>"""
+
 
-def list_upcoming_events(context_variables, max_results: int = 10, time_min: str = None):
+def list_upcoming_events(context_variables, max_results: int = 10, time_min: str = None,
+                         include_descriptions: bool = False):
     """
     List upcoming calendar events.
 
@@ -18,15 +44,16 @@ def list_upcoming_events(context_variables, max_results: int = 10, time_min: str
         context_variables (dict): A dictionary containing context information.
         max_results (int): Maximum number of events to return.
         time_min (str, optional): Start time in ISO format. If None, uses current time.
+        include_descriptions (bool): If True, return full event descriptions. Otherwise descriptions are shortened to 200 characters.
     """
-    logging.info(
-        f"Function called: list_upcoming_events(context_variables={context_variables}, max_results={max_results}, time_min={time_min})")
+    logging.info("Function called: list_upcoming_events(max_results=%s, time_min=%s, include_descriptions=%s)",
+                 max_results, time_min, include_descriptions)
 
-    _, service = authenticate_gmail()
     try:
+        service = get_calendar_service()
         if not time_min:
-            time_min = datetime.utcnow().isoformat() + 'Z'
-        else:
+            time_min = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        elif not RFC3339_UTC_PATTERN.fullmatch(time_min):
             # Convert the input time to datetime and ensure UTC format
             try:
                 # Parse the input time
@@ -36,37 +63,22 @@ def list_upcoming_events(context_variables, max_results: int = 10, time_min: str
             except ValueError as e:
                 return f"<result><error>Invalid time format: {str(e)}</error></result>"
 
-        events_result = service.events().list(
+        events_result = execute_request(service.events().list(
             calendarId='primary',
             timeMin=time_min,
             maxResults=max_results,
             singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+            orderBy='startTime',
+            fields='items(id,summary,start,end,location,description,attendees/email)'
+        ))
         events = events_result.get('items', [])
 
         if not events:
             return "<result><message>No upcoming events found.</message></result>"
 
-        event_info = []
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            end = event['end'].get('dateTime', event['end'].get('date'))
-            attendees = event.get('attendees', [])
-            attendee_list = [attendee['email'] for attendee in attendees if 'email' in attendee]
-
-            event_info.append(f"""<event>
-    <id>{event['id']}</id>
-    <summary>{event.get('summary', 'No title')}</summary>
-    <start>{start}</start>
-    <end>{end}</end>
-    <location>{event.get('location', 'No location')}</location>
-    <description>{event.get('description', 'No description')}</description>
-    <attendees>{', '.join(attendee_list)}</attendees>
-</event>""")
-
-        result = f"<result>\n{''.join(event_info)}\n</result>"
-        logging.info(f"Function list_upcoming_events() returned: {len(event_info)} events")
+        event_info = "".join(_format_event(event, include_descriptions) for event in events)
+        result = "<result>\n" + event_info + "\n</result>"
+        logging.info("Function list_upcoming_events() returned: %d events", len(events))
         return result
     except Exception as e:
         error_message = f"<result><error>Error listing events: {str(e)}</error></result>"
@@ -88,11 +100,11 @@ def create_event(context_variables, summary: str, start_time: str, end_time: str
         location (str, optional): Location of the event.
         attendees (str, optional): List of attendee email addresses, separated by commas (',').
     """
-    logging.info(
-        f"Function called: create_event(context_variables={context_variables}, summary='{summary}', start_time='{start_time}', end_time='{end_time}')")
+    logging.info("Function called: create_event(summary='%s', start_time='%s', end_time='%s')",
+                 summary, start_time, end_time)
 
-    _, service = authenticate_gmail()
     try:
+        service = get_calendar_service()
         event = {
             'summary': summary,
             'start': {'dateTime': start_time, 'timeZone': 'UTC'},
@@ -106,10 +118,10 @@ def create_event(context_variables, summary: str, start_time: str, end_time: str
         if attendees:
             event['attendees'] = [{'email': email} for email in attendees.split(',')]
 
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        event = execute_request(service.events().insert(calendarId='primary', body=event))
 
         result = f"<result><message>Event created successfully. Event ID: {event['id']}</message></result>"
-        logging.info(f"Function create_event() returned: {result}")
+        logging.info("Function create_event() returned: %s", result)
         return result
     except Exception as e:
         error_message = f"<result><error>Error creating event: {str(e)}</error></result>"
@@ -125,13 +137,13 @@ def delete_event(context_variables, event_id: str):
         context_variables (dict): A dictionary containing context information.
         event_id (str): The ID of the event to delete.
     """
-    logging.info(f"Function called: delete_event(context_variables={context_variables}, event_id='{event_id}')")
+    logging.info("Function called: delete_event(event_id='%s')", event_id)
 
-    _, service = authenticate_gmail()
     try:
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
+        service = get_calendar_service()
+        execute_request(service.events().delete(calendarId='primary', eventId=event_id))
         result = f"<result><message>Event {event_id} deleted successfully.</message></result>"
-        logging.info(f"Function delete_event() returned: {result}")
+        logging.info("Function delete_event() returned: %s", result)
         return result
     except Exception as e:
         error_message = f"<result><error>Error deleting event: {str(e)}</error></result>"
@@ -155,35 +167,33 @@ def update_event(context_variables, event_id: str, summary: str = None, start_ti
         location (str, optional): New location of the event.
         attendees (str, optional): List of attendee email addresses, separated by commas (',').
     """
-    logging.info(f"Function called: update_event(context_variables={context_variables}, event_id='{event_id}')")
+    logging.info("Function called: update_event(event_id='%s')", event_id)
 
-    _, service = authenticate_gmail()
     try:
-        # Get the existing event
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
-
-        # Update the fields that are provided
+        service = get_calendar_service()
+        # Send only the provided fields, the rest of the event is left unchanged
+        patch_body = {}
         if summary:
-            event['summary'] = summary
+            patch_body['summary'] = summary
         if start_time:
-            event['start']['dateTime'] = start_time
+            patch_body['start'] = {'dateTime': start_time, 'timeZone': 'UTC'}
         if end_time:
-            event['end']['dateTime'] = end_time
+            patch_body['end'] = {'dateTime': end_time, 'timeZone': 'UTC'}
         if description:
-            event['description'] = description
+            patch_body['description'] = description
         if location:
-            event['location'] = location
+            patch_body['location'] = location
         if attendees:
-            event['attendees'] = [{'email': email} for email in attendees.split(',')]
+            patch_body['attendees'] = [{'email': email} for email in attendees.split(',')]
 
-        updated_event = service.events().update(
+        execute_request(service.events().patch(
             calendarId='primary',
             eventId=event_id,
-            body=event
-        ).execute()
+            body=patch_body
+        ))
 
         result = f"<result><message>Event {event_id} updated successfully.</message></result>"
-        logging.info(f"Function update_event() returned: {result}")
+        logging.info("Function update_event() returned: %s", result)
         return result
     except Exception as e:
         error_message = f"<result><error>Error updating event: {str(e)}</error></result>"
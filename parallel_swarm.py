@@ -0,0 +1,150 @@
+import json
+import logging
+
+from swarm import Swarm
+from swarm.core import __CTX_VARS_NAME__
+from swarm.types import Response
+
+from common import TOOL_EXECUTOR
+
+
+def parallel_safe(func):
+    """Mark an agent function as safe to run concurrently with other tool calls."""
+    func.parallel_safe = True
+    return func
+
+
+def read_only(func):
+    """
+    Mark an agent function as having no side effects, so it may be dispatched while the completion
+    is still streaming. If the stream then fails, nothing has been sent or changed.
+    """
+    func.read_only = True
+    return parallel_safe(func)
+
+
+class ParallelSwarm(Swarm):
+    """
+    Swarm client that executes tool calls marked with `parallel_safe` concurrently.
+
+    When streaming, each `read_only` tool call is dispatched as soon as its arguments have been fully
+    received, so API calls overlap with the rest of the completion. Tools with side effects are only
+    run once the message is complete, concurrently if `parallel_safe`. Other tool calls (e.g. agent transfers)
+    use the default sequential handling, keeping Swarm's last-wins semantics for agent handoffs.
+    """
+
+    def __init__(self, client=None):
+        super().__init__(client)
+        self._dispatch_early = False
+        self._pending_tool_calls = {}
+
+    def run_and_stream(self, *args, execute_tools=True, **kwargs):
+        self._dispatch_early = execute_tools
+        yield from super().run_and_stream(*args, execute_tools=execute_tools, **kwargs)
+
+    def get_chat_completion(self, agent, history, context_variables, model_override, stream, debug):
+        completion = super().get_chat_completion(
+            agent=agent,
+            history=history,
+            context_variables=context_variables,
+            model_override=model_override,
+            stream=stream,
+            debug=debug,
+        )
+        if not stream or not self._dispatch_early:
+            return completion
+        # Calls dispatched for a completion that failed mid-stream never reach handle_tool_calls
+        self._pending_tool_calls.clear()
+        return self._dispatch_while_streaming(completion, agent.functions, context_variables)
+
+    def _dispatch_while_streaming(self, completion, functions, context_variables):
+        """Pass the stream through, submitting each tool call once the next one starts or the stream ends."""
+        function_map = {f.__name__: f for f in functions}
+        tool_calls = {}
+        dispatched = set()
+        in_order = True
+
+        for chunk in completion:
+            for delta in chunk.choices[0].delta.tool_calls or []:
+                if delta.index in dispatched:
+                    # Deltas arrived out of order, leave the remaining calls to handle_tool_calls
+                    in_order = False
+                if in_order:
+                    for index in [i for i in tool_calls if i < delta.index]:
+                        self._pending_tool_call(tool_calls.pop(index), function_map, context_variables)
+                        dispatched.add(index)
+
+                tool_call = tool_calls.setdefault(delta.index, {'id': '', 'name': '', 'arguments': ''})
+                tool_call['id'] += delta.id or ''
+                if delta.function:
+                    tool_call['name'] += delta.function.name or ''
+                    tool_call['arguments'] += delta.function.arguments or ''
+            yield chunk
+
+        if in_order:
+            for tool_call in tool_calls.values():
+                self._pending_tool_call(tool_call, function_map, context_variables)
+
+    def _pending_tool_call(self, tool_call, function_map, context_variables):
+        if not getattr(function_map.get(tool_call['name']), 'read_only', False):
+            return
+        future = self._submit_tool_call(
+            tool_call['name'], tool_call['arguments'], function_map, context_variables)
+        if future is not None:
+            self._pending_tool_calls[tool_call['id']] = future
+
+    @staticmethod
+    def _submit_tool_call(name, arguments, function_map, context_variables):
+        """Submit a parallel-safe tool call to the pool, or return None if it must run sequentially."""
+        func = function_map.get(name)
+        if not getattr(func, 'parallel_safe', False):
+            return None
+        try:
+            args = json.loads(arguments)
+        except ValueError:
+            return None
+        # pass context_variables to agent functions
+        if __CTX_VARS_NAME__ in func.__code__.co_varnames:
+            args[__CTX_VARS_NAME__] = context_variables
+        return TOOL_EXECUTOR.submit(func, **args)
+
+    def handle_tool_calls(self, tool_calls, functions, context_variables, debug):
+        function_map = {f.__name__: f for f in functions}
+        futures = {}
+        for tool_call in tool_calls:
+            future = self._pending_tool_calls.pop(tool_call.id, None)
+            if future is None and len(tool_calls) > 1:
+                future = self._submit_tool_call(
+                    tool_call.function.name, tool_call.function.arguments, function_map, context_variables)
+            if future is not None:
+                futures[tool_call.id] = future
+
+        if not futures:
+            return super().handle_tool_calls(tool_calls, functions, context_variables, debug)
+
+        logging.info("Running %d of %d tool calls in parallel", len(futures), len(tool_calls))
+        partial_response = Response(messages=[], agent=None, context_variables={})
+        for tool_call in tool_calls:
+            if tool_call.id not in futures:
+                response = super().handle_tool_calls([tool_call], functions, context_variables, debug)
+                partial_response.messages.extend(response.messages)
+                partial_response.context_variables.update(response.context_variables)
+                if response.agent:
+                    partial_response.agent = response.agent
+                continue
+
+            result = self.handle_function_result(futures[tool_call.id].result(), debug)
+            partial_response.messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "tool_name": tool_call.function.name,
+                    "content": result.value,
+                }
+            )
+            partial_response.context_variables.update(result.context_variables)
+            # keep Swarm's last-wins semantics for agent handoffs
+            if result.agent:
+                partial_response.agent = result.agent
+
+        return partial_response
@@ -1,7 +1,81 @@
 import logging
-from swarm.repl import run_demo_loop
+import re
+from swarm.repl.repl import process_and_print_streaming_response, pretty_print_messages
 
-from agents import default_context, base_agent
+from agents import (
+    build_context,
+    base_agent,
+    email_agent,
+    calendar_agent,
+    social_media_agent,
+    music_agent,
+    fanout_agent,
+)
+from parallel_swarm import ParallelSwarm
+
+# Broad "what about my day" questions go straight to the fan-out agent instead of the triage agent
+DAY_OVERVIEW_PATTERN = re.compile(
+    r"\b(my day|on my plate|today'?s plan|daily (summary|overview|briefing)|summar(y|ize) (of )?(my )?(day|today))\b",
+    re.IGNORECASE
+)
+
+# Single-intent messages go straight to the matching specialist, skipping the triage LLM call
+ROUTES = [
+    (re.compile(r"\b(e-?mails?|mails?|inbox|unread)\b", re.IGNORECASE), email_agent),
+    (re.compile(r"\b(calendar|meetings?|events?|appointments?|schedule)\b", re.IGNORECASE), calendar_agent),
+    (re.compile(r"\b(tweets?|twitter)\b", re.IGNORECASE), social_media_agent),
+    (re.compile(r"\b(play|songs?|music|spotify|tracks?|albums?|playlists?|pause)\b", re.IGNORECASE), music_agent),
+]
+
+
+def route(user_input, current_agent):
+    """
+    Pick the agent for the next turn. Only messages starting a new task are routed: while a specialist
+    is active, replies (e.g. confirming a draft) stay with it and it transfers back to the base agent itself.
+    Multi-domain requests go to the triage agent, and messages without any keyword stay with the current agent.
+    """
+    if current_agent not in (base_agent, fanout_agent):
+        return current_agent
+    if DAY_OVERVIEW_PATTERN.search(user_input):
+        return fanout_agent
+    matches = [agent for pattern, agent in ROUTES if pattern.search(user_input)]
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        return base_agent
+    return current_agent
+
+
+def run_demo_loop(starting_agent, context_factory=build_context, stream=False, debug=False):
+    """
+    Interactive loop equivalent to swarm.repl.run_demo_loop, using the parallel tool-calling client.
+    Context variables are rebuilt by `context_factory` on every turn so they stay current.
+    """
+    client = ParallelSwarm()
+    print("Starting Swarm CLI 🐝")
+
+    messages = []
+    agent = starting_agent
+
+    while True:
+        user_input = input("\033[90mUser\033[0m: ")
+        messages.append({"role": "user", "content": user_input})
+        agent = route(user_input, agent)
+
+        response = client.run(
+            agent=agent,
+            messages=messages,
+            context_variables=context_factory(),
+            stream=stream,
+            debug=debug,
+        )
+        if stream:
+            response = process_and_print_streaming_response(response)
+        else:
+            pretty_print_messages(response.messages)
+
+        messages.extend(response.messages)
+        agent = response.agent
 
 
 if __name__ == "__main__":
@@ -13,4 +87,4 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
 
     # Run the demo loop with the triage agent
-    run_demo_loop(base_agent, stream=True, context_variables=default_context)
+    run_demo_loop(base_agent, stream=True, context_factory=build_context)
@@ -1,33 +1,78 @@
 import os
 
-from dotenv import load_dotenv
 import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+from html import escape
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-from functools import lru_cache
+from urllib3.util import Retry
 
-# Load environment variables
-load_dotenv()
+try:
+    import orjson
+except ImportError:  # optional, responses are then decoded with the stdlib json module
+    orjson = None
+
+from common import pooled_session, TokenBucket
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-@lru_cache(maxsize=1)
+
+@dataclass(frozen=True, slots=True)
+class SpotifyCredentials:
+    client_id: str | None
+    client_secret: str | None
+    redirect_uri: str | None
+
+
+# Spotify app credentials, read once from the environment loaded by common
+SPOTIFY_CREDENTIALS = SpotifyCredentials(
+    client_id=os.getenv('SPOTIFY_CLIENT_ID'),
+    client_secret=os.getenv('SPOTIFY_CLIENT_SECRET'),
+    redirect_uri=os.getenv('SPOTIFY_REDIRECT_URI'),
+)
+
+# Single client shared by all tool calls, including ones running concurrently on the tool executor
+_spotify_client = None
+_spotify_lock = threading.Lock()
+
+# Spotify rate limits over a rolling window, pace requests instead of waiting out Retry-After
+SPOTIFY_RATE_LIMIT = TokenBucket(rpm=180, burst=30)
+
+# Identical searches within this many seconds (e.g. a retried command) reuse the previous results
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_SIZE = 512
+_search_cache = {}
+_search_cache_lock = threading.Lock()
+
+# Repeated playback state requests within this many seconds reuse the previous response
+PLAYBACK_CACHE_TTL = 1.0
+_playback_cache = {'ts': 0.0, 'value': None}
+
+
 def get_spotify_client():
     """
-    Returns a cached Spotify client. Will only authenticate once and reuse the client.
+    Returns the shared Spotify client. Will only authenticate once and reuse the client.
     """
-    try:
-        client_id = os.getenv('SPOTIFY_CLIENT_ID')
-        client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
-        redirect_uri = os.getenv('SPOTIFY_REDIRECT_URI')
+    global _spotify_client
+    with _spotify_lock:
+        if _spotify_client is None:
+            _spotify_client = _create_spotify_client()
+        return _spotify_client
+
 
+def _create_spotify_client():
+    """Authenticate with Spotify and create a client."""
+    try:
         scope = "user-read-playback-state user-modify-playback-state user-read-currently-playing playlist-read-private playlist-modify-public playlist-modify-private user-library-read user-library-modify"
 
         auth_manager = SpotifyOAuth(
-            client_id=client_id,
-            client_secret=client_secret,
-            redirect_uri=redirect_uri,
+            client_id=SPOTIFY_CREDENTIALS.client_id,
+            client_secret=SPOTIFY_CREDENTIALS.client_secret,
+            redirect_uri=SPOTIFY_CREDENTIALS.redirect_uri,
             scope=scope,
             open_browser=False
         )
@@ -36,7 +81,7 @@ def get_spotify_client():
         if not auth_manager.validate_token(auth_manager.cache_handler.get_cached_token()):
             # Get the authorization URL
             auth_url = auth_manager.get_authorize_url()
-            logging.info(f"Waiting for user to visit the authorization URL: {auth_url}")
+            logging.info("Waiting for user to visit the authorization URL: %s", auth_url)
 
             # Wait for the authorization code from user
             # TODO: wait for telegram message with the code
@@ -45,12 +90,179 @@ def get_spotify_client():
             # Get access token using the authorization code
             auth_manager.get_access_token(auth_code)
 
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        # Reuse keep-alive connections to api.spotify.com and retry transient errors
+        session = pooled_session(
+            pool_maxsize=20,
+            retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+            rate_limit=SPOTIFY_RATE_LIMIT
+        )
+        if orjson is not None:
+            session.hooks['response'].append(_decode_with_orjson)
+        sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
         return sp
     except Exception as e:
-        logging.error(f"Error authenticating with Spotify: {str(e)}")
+        logging.error("Error authenticating with Spotify: %s", e)
         raise
 
+def _decode_with_orjson(response, *args, **kwargs):
+    """Response hook that makes response.json(), which spotipy uses for every API call, decode with orjson."""
+    # orjson.JSONDecodeError subclasses ValueError, which spotipy handles for empty bodies
+    response.json = lambda **_: orjson.loads(response.content)
+    return response
+
+# Result templates, filled from an _ItemView of the Spotify item
+_PLAY_TRACK_TEMPLATE = """<result>
+<message>Now playing track: {name} by {artist_name}</message>
+<track_info>
+    <name>{name}</name>
+    <artist>{artist_name}</artist>
+    <album>{album_name}</album>
+    <duration>{duration_ms}</duration>
+</track_info>
+</result>"""
+
+_PLAY_ALBUM_TEMPLATE = """<result>
+<message>Now playing album: {name} by {artist_name}</message>
+<album_info>
+    <name>{name}</name>
+    <artist>{artist_name}</artist>
+    <total_tracks>{total_tracks}</total_tracks>
+</album_info>
+</result>"""
+
+_PLAY_ARTIST_TEMPLATE = """<result>
+<message>Now playing top tracks from artist: {name}</message>
+<artist_info>
+    <name>{name}</name>
+    <popularity>{popularity}</popularity>
+</artist_info>
+</result>"""
+
+_PLAY_PLAYLIST_TEMPLATE = """<result>
+<message>Now playing playlist: {name}</message>
+<playlist_info>
+    <name>{name}</name>
+    <owner>{owner_name}</owner>
+    <tracks_total>{tracks_total}</tracks_total>
+</playlist_info>
+</result>"""
+
+_PUBLISHED_ITEM_TEMPLATE = """<{tag}>
+    <name>{{name}}</name>
+    <publisher>{{publisher}}</publisher>
+    <uri>{{uri}}</uri>
+</{tag}>"""
+
+_SEARCH_TEMPLATES = {
+    'track': """<track>
+    <name>{name}</name>
+    <artist>{artist_name}</artist>
+    <album>{album_name}</album>
+    <duration>{duration_ms}</duration>
+    <uri>{uri}</uri>
+</track>""",
+    'album': """<album>
+    <name>{name}</name>
+    <artist>{artist_name}</artist>
+    <total_tracks>{total_tracks}</total_tracks>
+    <uri>{uri}</uri>
+</album>""",
+    'artist': """<artist>
+    <name>{name}</name>
+    <popularity>{popularity}</popularity>
+    <uri>{uri}</uri>
+</artist>""",
+    'playlist': """<playlist>
+    <name>{name}</name>
+    <owner>{owner_name}</owner>
+    <tracks_total>{tracks_total}</tracks_total>
+    <uri>{uri}</uri>
+</playlist>""",
+    'show': _PUBLISHED_ITEM_TEMPLATE.format(tag='show'),
+    'episode': _PUBLISHED_ITEM_TEMPLATE.format(tag='episode'),
+    'audiobook': _PUBLISHED_ITEM_TEMPLATE.format(tag='audiobook'),
+}
+
+SEARCH_TYPES = frozenset(_SEARCH_TEMPLATES)
+
+# Nested item fields exposed as flat template keys
+_DERIVED_FIELDS = {
+    'artist_name': lambda item: item['artists'][0]['name'],
+    'album_name': lambda item: item['album']['name'],
+    'owner_name': lambda item: item['owner']['display_name'],
+    'tracks_total': lambda item: item['tracks']['total'],
+}
+
+class _ItemView(dict):
+    """
+    Spotify item that resolves nested fields used by the result templates on access
+    and escapes text values so names like 'Simon & Garfunkel' keep the result valid XML.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        return escape(value, quote=False) if isinstance(value, str) else value
+
+    def __missing__(self, key):
+        return _DERIVED_FIELDS[key](self)
+
+def _play_track(sp, item):
+    sp.start_playback(uris=[item['uri']])
+    return _PLAY_TRACK_TEMPLATE.format_map(_ItemView(item))
+
+def _play_album(sp, item):
+    sp.start_playback(context_uri=item['uri'])
+    return _PLAY_ALBUM_TEMPLATE.format_map(_ItemView(item))
+
+def _play_artist(sp, item):
+    sp.start_playback(context_uri=item['uri'])
+    return _PLAY_ARTIST_TEMPLATE.format_map(_ItemView(item))
+
+def _play_playlist(sp, item):
+    sp.start_playback(context_uri=item['uri'])
+    return _PLAY_PLAYLIST_TEMPLATE.format_map(_ItemView(item))
+
+# Starts playback of a found item and returns the result, by content type
+_PLAY_HANDLERS: dict[str, Callable[[spotipy.Spotify, dict], str]] = {
+    'track': _play_track,
+    'album': _play_album,
+    'artist': _play_artist,
+    'playlist': _play_playlist,
+}
+PLAY_TYPES = frozenset(_PLAY_HANDLERS)
+
+def _cached_search(sp, query: str, search_type: str, limit: int):
+    """Search Spotify, reusing the results of an identical search from the last SEARCH_CACHE_TTL seconds."""
+    key = (query.strip().lower(), search_type, limit)
+    now = time.monotonic()
+    with _search_cache_lock:
+        cached = _search_cache.get(key)
+    if cached and now - cached[0] < SEARCH_CACHE_TTL:
+        return cached[1]
+
+    results = sp.search(q=query, type=search_type, limit=limit)
+
+    with _search_cache_lock:
+        _search_cache.pop(key, None)
+        if len(_search_cache) >= SEARCH_CACHE_SIZE:
+            # Dicts keep insertion order, so the first key is the oldest entry
+            _search_cache.pop(next(iter(_search_cache)))
+        _search_cache[key] = (now, results)
+    return results
+
+def _current_playback(sp):
+    """Return the current playback state, reusing a response from the last PLAYBACK_CACHE_TTL seconds."""
+    now = time.monotonic()
+    if now - _playback_cache['ts'] < PLAYBACK_CACHE_TTL:
+        return _playback_cache['value']
+    value = sp.current_playback()
+    _playback_cache.update(ts=now, value=value)
+    return value
+
+def _invalidate_playback():
+    """Drop the cached playback state after changing what is playing."""
+    _playback_cache['ts'] = 0.0
+
 def play(context_variables, query: str, content_type: str = 'track'):
     """
     Search for and play Spotify content by name.
@@ -60,17 +272,16 @@ def play(context_variables, query: str, content_type: str = 'track'):
         query (str): The name/query to search for.
         content_type (str): Type of content to play ('track', 'album', 'artist', 'playlist')
     """
-    logging.info(f"Function called: play(context_variables={context_variables}, query='{query}', content_type='{content_type}')")
+    logging.info("Function called: play(query='%s', content_type='%s')", query, content_type)
 
     sp = get_spotify_client()
     try:
         # Validate content type
-        valid_types = {'track', 'album', 'artist', 'playlist'}
-        if content_type not in valid_types:
-            return f"<result><error>Invalid content type: '{content_type}'. Valid types are: {', '.join(valid_types)}</error></result>"
+        if content_type not in PLAY_TYPES:
+            return f"<result><error>Invalid content type: '{content_type}'. Valid types are: {', '.join(sorted(PLAY_TYPES))}</error></result>"
 
         # Search for the content
-        results = sp.search(q=query, type=content_type, limit=1)
+        results = _cached_search(sp, query, content_type, 1)
 
         items_key = f"{content_type}s"
         if not results[items_key]['items']:
@@ -79,48 +290,10 @@ def play(context_variables, query: str, content_type: str = 'track'):
         item = results[items_key]['items'][0]
 
         # Play the content based on its type
-        if content_type == 'track':
-            sp.start_playback(uris=[item['uri']])
-            result = f"""<result>
-<message>Now playing track: {item['name']} by {item['artists'][0]['name']}</message>
-<track_info>
-    <name>{item['name']}</name>
-    <artist>{item['artists'][0]['name']}</artist>
-    <album>{item['album']['name']}</album>
-    <duration>{item['duration_ms']}</duration>
-</track_info>
-</result>"""
-        elif content_type == 'album':
-            sp.start_playback(context_uri=item['uri'])
-            result = f"""<result>
-<message>Now playing album: {item['name']} by {item['artists'][0]['name']}</message>
-<album_info>
-    <name>{item['name']}</name>
-    <artist>{item['artists'][0]['name']}</artist>
-    <total_tracks>{item['total_tracks']}</total_tracks>
-</album_info>
-</result>"""
-        elif content_type == 'artist':
-            sp.start_playback(context_uri=item['uri'])
-            result = f"""<result>
-<message>Now playing top tracks from artist: {item['name']}</message>
-<artist_info>
-    <name>{item['name']}</name>
-    <popularity>{item['popularity']}</popularity>
-</artist_info>
-</result>"""
-        elif content_type == 'playlist':
-            sp.start_playback(context_uri=item['uri'])
-            result = f"""<result>
-<message>Now playing playlist: {item['name']}</message>
-<playlist_info>
-    <name>{item['name']}</name>
-    <owner>{item['owner']['display_name']}</owner>
-    <tracks_total>{item['tracks']['total']}</tracks_total>
-</playlist_info>
-</result>"""
+        result = _PLAY_HANDLERS[content_type](sp, item)
+        _invalidate_playback()
 
-        logging.info(f"Function play() started playing {content_type}: {item['name']}")
+        logging.info("Function play() started playing %s: %s", content_type, item['name'])
         return result
     except Exception as e:
         error_message = f"<result><error>Error playing {content_type}: {str(e)}</error></result>"
@@ -134,11 +307,11 @@ def get_current_track(context_variables):
     Args:
         context_variables (dict): A dictionary containing context information.
     """
-    logging.info(f"Function called: get_current_track(context_variables={context_variables})")
+    logging.info("Function called: get_current_track()")
 
     sp = get_spotify_client()  # Use cached client instead
     try:
-        current = sp.current_playback()
+        current = _current_playback(sp)
 
         if not current or not current['item']:
             return "<result><message>No track currently playing</message></result>"
@@ -146,15 +319,15 @@ def get_current_track(context_variables):
         track = current['item']
         result = f"""<result>
 <track_info>
-    <name>{track['name']}</name>
-    <artist>{track['artists'][0]['name']}</artist>
-    <album>{track['album']['name']}</album>
+    <name>{escape(track['name'], quote=False)}</name>
+    <artist>{escape(track['artists'][0]['name'], quote=False)}</artist>
+    <album>{escape(track['album']['name'], quote=False)}</album>
     <progress>{current['progress_ms']}</progress>
     <duration>{track['duration_ms']}</duration>
     <is_playing>{current['is_playing']}</is_playing>
 </track_info>
 </result>"""
-        logging.info(f"Function get_current_track() returned current track info")
+        logging.info("Function get_current_track() returned current track info")
         return result
     except Exception as e:
         error_message = f"<result><error>Error getting current track: {str(e)}</error></result>"
@@ -169,7 +342,7 @@ def control_playback(context_variables, action: str):
         context_variables (dict): A dictionary containing context information.
         action (str): The playback control action ('play', 'pause', 'next', 'previous')
     """
-    logging.info(f"Function called: control_playback(context_variables={context_variables}, action='{action}')")
+    logging.info("Function called: control_playback(action='%s')", action)
 
     sp = get_spotify_client()  # Use cached client instead
     try:
@@ -187,9 +360,10 @@ def control_playback(context_variables, action: str):
             message = "Returned to previous track"
         else:
             return f"<result><error>Invalid action: {action}</error></result>"
+        _invalidate_playback()
 
         result = f"<result><message>{message}</message></result>"
-        logging.info(f"Function control_playback() executed action: {action}")
+        logging.info("Function control_playback() executed action: %s", action)
         return result
     except Exception as e:
         error_message = f"<result><error>Error controlling playback: {str(e)}</error></result>"
@@ -203,69 +377,36 @@ def search(context_variables, query: str, search_type: str = 'track', limit: int
     Args:
         context_variables (dict): A dictionary containing context information.
         query (str): The search query.
-        search_type (str): Type of search ('album', 'artist', 'playlist', 'track', 'show', 'episode', 'audiobook').
-        limit (int): Maximum number of results to return.
+        search_type (str): Type of search ('album', 'artist', 'playlist', 'track', 'show', 'episode', 'audiobook'). Several types can be searched at once by separating them with commas, i.e. 'track,artist'.
+        limit (int): Maximum number of results to return per type.
     """
-    logging.info(f"Function called: search_items(context_variables={context_variables}, query='{query}', type='{search_type}', limit={limit})")
+    logging.info("Function called: search_items(query='%s', type='%s', limit=%s)", query, search_type, limit)
 
     sp = get_spotify_client()
     try:
-        # Validate search type
-        valid_types = {'album', 'artist', 'playlist', 'track', 'show', 'episode', 'audiobook'}
-        if search_type not in valid_types:
-            return f"<result><error>Invalid search type: '{search_type}'. Valid types are: {', '.join(valid_types)}</error></result>"
+        # Validate search types
+        search_types = [t.strip() for t in search_type.split(',') if t.strip()]
+        invalid_types = [t for t in search_types if t not in SEARCH_TYPES]
+        if not search_types or invalid_types:
+            return f"<result><error>Invalid search type: '{search_type}'. Valid types are: {', '.join(sorted(SEARCH_TYPES))}</error></result>"
 
-        results = sp.search(q=query, type=search_type, limit=limit)
-
-        # Get the correct key from results based on search_type (Spotify adds 's' to the type)
-        items_key = f"{search_type}s"
-        if not results[items_key]['items']:
-            return f"<result><message>No {search_type}s found matching: '{query}'</message></result>"
+        # All types are fetched with a single request
+        results = _cached_search(sp, query, ','.join(search_types), limit)
 
         items_info = []
-        for item in results[items_key]['items']:
-            if search_type == 'track':
-                item_info = f"""<track>
-    <name>{item['name']}</name>
-    <artist>{item['artists'][0]['name']}</artist>
-    <album>{item['album']['name']}</album>
-    <duration>{item['duration_ms']}</duration>
-    <uri>{item['uri']}</uri>
-</track>"""
-            elif search_type == 'album':
-                item_info = f"""<album>
-    <name>{item['name']}</name>
-    <artist>{item['artists'][0]['name']}</artist>
-    <total_tracks>{item['total_tracks']}</total_tracks>
-    <uri>{item['uri']}</uri>
-</album>"""
-            elif search_type == 'artist':
-                item_info = f"""<artist>
-    <name>{item['name']}</name>
-    <popularity>{item['popularity']}</popularity>
-    <uri>{item['uri']}</uri>
-</artist>"""
-            elif search_type == 'playlist':
-                item_info = f"""<playlist>
-    <name>{item['name']}</name>
-    <owner>{item['owner']['display_name']}</owner>
-    <tracks_total>{item['tracks']['total']}</tracks_total>
-    <uri>{item['uri']}</uri>
-</playlist>"""
-            elif search_type in {'show', 'episode', 'audiobook'}:
-                item_info = f"""<{search_type}>
-    <name>{item['name']}</name>
-    <publisher>{item['publisher']}</publisher>
-    <uri>{item['uri']}</uri>
-</{search_type}>"""
-
-            items_info.append(item_info)
+        for item_type in search_types:
+            # Get the correct key from results based on the type (Spotify adds 's' to the type)
+            template = _SEARCH_TEMPLATES[item_type]
+            items_info.extend(template.format_map(_ItemView(item)) for item in results[f"{item_type}s"]['items'])
+
+        if not items_info:
+            return f"<result><message>No {search_type} results found matching: '{query}'</message></result>"
 
         result = f"<result>\n{''.join(items_info)}\n</result>"
-        logging.info(f"Function search_items() returned: {len(items_info)} {search_type}s")
+        logging.info("Function search_items() returned: %d items of type %s", len(items_info), search_type)
         return result
     except Exception as e:
-        error_message = f"<result><error>Error searching {search_type}s: {str(e)}</error></result>"
+        error_message = f"<result><error>Error searching {search_type}: {str(e)}</error></result>"
         logging.error(error_message)
         return error_message
 
@@ -275,4 +416,4 @@ if __name__ == "__main__":
         sp = get_spotify_client()  # Use cached client instead
         logging.info("Spotify authentication successful!")
     except Exception as e:
-        logging.error(f"Spotify authentication failed: {str(e)}")
\ No newline at end of file
+        logging.error("Spotify authentication failed: %s", e)
\ No newline at end of file
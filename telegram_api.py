@@ -1,5 +1,8 @@
+import asyncio
+import io
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import (
     filters,
@@ -9,22 +12,44 @@ from telegram.ext import (
     ContextTypes,
     CallbackContext,
 )
-import whisper
+import ctranslate2
+import numpy as np
+from faster_whisper import WhisperModel
 from pydub import AudioSegment
 
+try:
+    import uvloop
+except ImportError:  # optional, the default asyncio event loop is used otherwise
+    uvloop = None
+
+try:
+    import h2  # noqa: F401
+    HTTP_VERSION = "2"
+except ImportError:  # optional, installed with python-telegram-bot[http2]
+    HTTP_VERSION = "1.1"
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
+# Whisper expects 16 kHz mono float32 samples in [-1, 1]
+WHISPER_SAMPLE_RATE = 16000
+
+# Leave cores free for the event loop and the decoding threads
+WHISPER_CPU_THREADS = min(4, os.cpu_count() or 1)
+
 CHECK_ALLOWED = False
-ALLOWED_USERS = ["5158783121"]
-ADMIN_USERS = ["5158783121"]
+ALLOWED_USERS = frozenset({"5158783121"})
+ADMIN_USERS = frozenset({"5158783121"})
 
 
 def check_allowed_user(func):
+    # Bound once per decorated handler instead of looked up as globals on every update
+    check_allowed, allowed_users = CHECK_ALLOWED, ALLOWED_USERS
+
     async def wrapper(self, update: Update, context: CallbackContext, *args, **kwargs):
-        if CHECK_ALLOWED and str(update.effective_user.id) not in ALLOWED_USERS:
-            print(update.effective_user.id)
+        if check_allowed and str(update.effective_user.id) not in allowed_users:
+            logging.warning("Rejected message from user %s", update.effective_user.id)
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text="Nie masz uprawnień do korzystania z tego bota 😥",
@@ -36,9 +61,11 @@ def check_allowed_user(func):
 
 
 def check_admin_user(func):
+    admin_users = ADMIN_USERS
+
     async def wrapper(self, update: Update, context: CallbackContext, *args, **kwargs):
-        if str(update.effective_user.id) not in ADMIN_USERS:
-            print(update.effective_user.id)
+        if str(update.effective_user.id) not in admin_users:
+            logging.warning("Rejected admin command from user %s", update.effective_user.id)
             await context.bot.send_message(
                 chat_id=update.effective_chat.id, text="Nie jestes adminem."
             )
@@ -48,10 +75,38 @@ def check_admin_user(func):
     return wrapper
 
 
+def decode_voice(buffer: io.BytesIO) -> np.ndarray:
+    """Decode an OGG voice message in memory into the sample array Whisper expects."""
+    segment = AudioSegment.from_file(buffer, format="ogg")
+    segment = segment.set_frame_rate(WHISPER_SAMPLE_RATE).set_channels(1).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
 class TelegramBot:
     def __init__(self, api_key: str):
-        self.application = ApplicationBuilder().token(api_key).build()
-        self.whisper_model = whisper.load_model("tiny.en")  # or "tiny", "small", "medium", "large"
+        # HTTP/2, when available, multiplexes Bot API calls over one connection, and updates are
+        # handled concurrently so a transcription doesn't hold back other chats
+        self.application = (
+            ApplicationBuilder()
+            .token(api_key)
+            .http_version(HTTP_VERSION)
+            .get_updates_http_version(HTTP_VERSION)
+            .concurrent_updates(True)
+            .build()
+        )
+        # float16 on GPU, int8 quantized on CPU
+        if ctranslate2.get_cuda_device_count() > 0:
+            device, compute_type = "cuda", "float16"
+        else:
+            device, compute_type = "cpu", "int8"
+        logging.info("Loading Whisper model on %s (%s)", device, compute_type)
+        # or "tiny", "small", "medium", "large"
+        self.whisper_model = WhisperModel("tiny.en", device=device, compute_type=compute_type,
+                                          cpu_threads=WHISPER_CPU_THREADS)
+        # The model is not shared between threads, transcriptions run one at a time on this worker
+        self._whisper_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+        # One second of silence, so the first voice message doesn't pay for allocations and kernel setup
+        self.transcribe(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32))
         self._setup_handlers()
 
     def _setup_handlers(self):
@@ -117,11 +172,33 @@ class TelegramBot:
         voice = update.message.voice
         file_id = voice.file_id
         new_file = await context.bot.get_file(file_id)
-        await new_file.download_to_drive("voice.ogg")
-        transcript = self.whisper_model.transcribe("voice.ogg")
-        await self.send_message(update.effective_chat.id, transcript["text"])
+        buffer = io.BytesIO()
+        await new_file.download_to_memory(out=buffer)
+        buffer.seek(0)
+        # Decoding and inference are blocking, keep them off the event loop
+        loop = asyncio.get_running_loop()
+        audio = await loop.run_in_executor(None, decode_voice, buffer)
+        transcript = await loop.run_in_executor(self._whisper_pool, self.transcribe, audio)
+        await self.send_message(update.effective_chat.id, transcript)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        """Transcribe 16 kHz mono audio samples to text."""
+        # Voice commands are short: greedy decoding without temperature fallback, timestamps or
+        # conditioning on previous windows gives a single decoder pass per utterance
+        segments, _ = self.whisper_model.transcribe(
+            audio,
+            beam_size=1,
+            best_of=1,
+            temperature=0,
+            condition_on_previous_text=False,
+            no_speech_threshold=0.6,
+            without_timestamps=True,
+        )
+        return "".join(segment.text for segment in segments)
 
     def run(self):
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
         self.application.run_polling()
 
 
@@ -1,29 +1,47 @@
-from dotenv import load_dotenv
 import os
 import tweepy
 import logging
+from dataclasses import dataclass
+from functools import lru_cache
 
-# Load environment variables
-load_dotenv()
+from common import pooled_session, TokenBucket
 
+
+@dataclass(frozen=True, slots=True)
+class TwitterCredentials:
+    bearer_token: str | None
+    consumer_key: str | None
+    consumer_secret: str | None
+    access_token: str | None
+    access_token_secret: str | None
+
+
+# Twitter API credentials, read once from the environment loaded by common
+TWITTER_CREDENTIALS = TwitterCredentials(
+    bearer_token=os.getenv("TWITTER_BEARER_TOKEN"),
+    consumer_key=os.getenv("TWITTER_CONSUMER_KEY"),
+    consumer_secret=os.getenv("TWITTER_CONSUMER_SECRET"),
+    access_token=os.getenv("TWITTER_ACCESS_TOKEN"),
+    access_token_secret=os.getenv("TWITTER_ACCESS_TOKEN_SECRET"),
+)
+
+# Tweet creation is limited per 15 minute window, stay below it instead of hitting 429s
+TWITTER_RATE_LIMIT = TokenBucket(rpm=6, burst=5)
+
+@lru_cache(maxsize=1)
 def authenticate_twitter():
-    """Authenticate and return Twitter API v2 client."""
+    """Authenticate and return a cached Twitter API v2 client."""
     logging.info("Function called: authenticate_twitter()")
-    
-    # Load Twitter API credentials from environment variables
-    bearer_token = os.getenv("TWITTER_BEARER_TOKEN")
-    consumer_key = os.getenv("TWITTER_CONSUMER_KEY")
-    consumer_secret = os.getenv("TWITTER_CONSUMER_SECRET")
-    access_token = os.getenv("TWITTER_ACCESS_TOKEN")
-    access_token_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
 
     client = tweepy.Client(
-        bearer_token=bearer_token,
-        consumer_key=consumer_key,
-        consumer_secret=consumer_secret,
-        access_token=access_token,
-        access_token_secret=access_token_secret
+        bearer_token=TWITTER_CREDENTIALS.bearer_token,
+        consumer_key=TWITTER_CREDENTIALS.consumer_key,
+        consumer_secret=TWITTER_CREDENTIALS.consumer_secret,
+        access_token=TWITTER_CREDENTIALS.access_token,
+        access_token_secret=TWITTER_CREDENTIALS.access_token_secret
     )
+    # Reuse keep-alive connections to the Twitter API across tweets
+    client.session = pooled_session(pool_maxsize=10, rate_limit=TWITTER_RATE_LIMIT)
     
     logging.info("Function authenticate_twitter() returned: Twitter API v2 client")
     return client
@@ -36,13 +54,13 @@ def send_tweet(context_variables, tweet_content: str):
         context_variables (dict): A dictionary containing context information.
         tweet_content (str): The content of the tweet to be sent.
     """
-    logging.info(f"Function called: send_tweet(context_variables={context_variables}, tweet_content='{tweet_content[:20]}...')")
+    logging.info("Function called: send_tweet(tweet_content='%.20s...')", tweet_content)
     
     client = authenticate_twitter()
     try:
         response = client.create_tweet(text=tweet_content)
         result = f"<result><message>Tweet sent successfully. Tweet ID: {response.data['id']}</message></result>"
-        logging.info(f"Function send_tweet() returned: {result}")
+        logging.info("Function send_tweet() returned: %s", result)
         return result
     except Exception as e:
         error_message = f"<result><error>Error sending tweet: {str(e)}</error></result>"